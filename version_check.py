@@ -1,14 +1,52 @@
 import os
+import json
+import time
+import hashlib
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+import orjson
 import requests
 import sqlite3
 import markdown
-from flask import Flask, render_template_string, request, redirect, send_file
+from html import unescape
+from markdown.treeprocessors import Treeprocessor
+from markdown.util import AMP_SUBSTITUTE
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from packaging.version import Version, InvalidVersion
+from flask import Flask, render_template, request, redirect, send_file, make_response
 
 app = Flask(__name__)
 # Database must live in the volume-mapped folder
 DB_PATH = "/app/data/monitor.db"
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+# Token pool, read from GITHUB_TOKENS/GITHUB_TOKEN on first use by github_tokens()
+GITHUB_TOKENS = None
 DASHBOARD_VERSION = "v1.2"
+# The dashboard's own repo, pinned to the top and protected from deletion
+SYSTEM_OWNER, SYSTEM_REPO = "darenbooth", "version-monitor"
+# Cap parallel GitHub requests to stay clear of the secondary rate limit
+GITHUB_MAX_WORKERS = 8
+GITHUB_MAX_RETRIES = 3
+# Total seconds one GitHub call may spend sleeping across all its rate-limit retries
+GITHUB_MAX_BACKOFF = 30
+# Repos per GraphQL query; keeps each batch well inside GitHub's query complexity limits
+GITHUB_GRAPHQL_BATCH = 50
+# Rest a token once it has fewer calls than this left in its rate-limit window
+GITHUB_TOKEN_RESERVE = 5
+# Default minimum seconds between GraphQL refreshes of the same repo list
+GITHUB_POLL_INTERVAL = 60
+
+# One shared session so every lookup reuses pooled keep-alive connections to api.github.com
+_SESSION = requests.Session()
+_SESSION.headers.update({"Accept": "application/vnd.github+json"})
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=GITHUB_MAX_WORKERS))
+
+_token_cycle = None
+_token_lock = threading.Lock()
+# (token, rate-limit resource) -> epoch time when that budget resets
+_token_exhausted_until = {}
 
 # --- DATABASE SETUP ---
 def init_db():
@@ -20,36 +58,313 @@ def init_db():
     # Create the table
     c.execute('''CREATE TABLE IF NOT EXISTS repos 
                  (id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT, repo TEXT, current_ver TEXT, notes TEXT)''')
+    # GitHub response cache. REST rows (keyed by URL) are reused until expires, then
+    # revalidated with a free 304; the GraphQL batch row (keyed "graphql:<repo list>")
+    # has no validators and is simply refetched once it expires
+    c.execute('''CREATE TABLE IF NOT EXISTS http_cache
+                 (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB, expires REAL)''')
     
     # Check if the system repo exists, if not, add it with your custom note
-    c.execute("SELECT count(*) FROM repos WHERE repo = 'version-monitor'")
+    c.execute("SELECT count(*) FROM repos WHERE owner = ? AND repo = ?", (SYSTEM_OWNER, SYSTEM_REPO))
     if c.fetchone()[0] == 0:
         default_note = "## To Find Version:\r\n\r\nThe version is proudly displayed at the top of the page.\r\n\r\n## To Update:\r\n\r\n`cd path/to/directory`\r\n\r\n`docker compose pull && docker compose up -d`\r\n\r\n## Donation:\r\n\r\nIf you find this container useful, please consider donating a couple of dollars to me here:\r\n\r\n<https://www.paypal.com/donate?hosted_button_id=3TL69W8RM7CYE>"
         c.execute("INSERT INTO repos (owner, repo, current_ver, notes) VALUES (?, ?, ?, ?)",
-                  ("darenbooth", "version-monitor", DASHBOARD_VERSION, default_note))
+                  (SYSTEM_OWNER, SYSTEM_REPO, DASHBOARD_VERSION, default_note))
     conn.commit()
     conn.close()
 
+def github_tokens():
+    """Returns the GitHub token pool, loading it from the environment on first call.
+
+    GITHUB_TOKENS is an optional comma-separated list rotated per request to multiply
+    the rate limit; it defaults to the single GITHUB_TOKEN.
+    """
+    global GITHUB_TOKENS, _token_cycle
+    with _token_lock:
+        if GITHUB_TOKENS is None:
+            raw = os.getenv("GITHUB_TOKENS", os.getenv("GITHUB_TOKEN", ""))
+            GITHUB_TOKENS = [t.strip() for t in raw.split(",") if t.strip()]
+            _token_cycle = itertools.cycle(GITHUB_TOKENS)
+    return GITHUB_TOKENS
+
+def github_headers(resource="core"):
+    """Returns auth headers for the next token in the rotation, or None if no token is set.
+
+    Tokens that are nearly out of budget for the given rate-limit resource are skipped
+    until their reset time, unless every token is in that state.
+    """
+    tokens = github_tokens()
+    if not tokens:
+        return None
+    now = time.time()
+    with _token_lock:
+        for _ in range(len(tokens)):
+            token = next(_token_cycle)
+            if _token_exhausted_until.get((token, resource), 0) <= now:
+                break
+    return {"Authorization": f"token {token}"}
+
+def github_token_available(resource="core"):
+    """Returns True if any token still has budget for the given rate-limit resource."""
+    tokens = github_tokens()
+    now = time.time()
+    with _token_lock:
+        return any(_token_exhausted_until.get((t, resource), 0) <= now for t in tokens)
+
+def note_rate_limit(headers, r):
+    """Records when the token behind a request is running low on its rate limit."""
+    remaining = r.headers.get("X-RateLimit-Remaining")
+    reset = r.headers.get("X-RateLimit-Reset")
+    if remaining is None or reset is None or "Authorization" not in headers:
+        return
+    token = headers["Authorization"].split(" ", 1)[1]
+    key = (token, r.headers.get("X-RateLimit-Resource", "core"))
+    with _token_lock:
+        if int(remaining) < GITHUB_TOKEN_RESERVE:
+            _token_exhausted_until[key] = float(reset)
+        else:
+            _token_exhausted_until.pop(key, None)
+
+def retry_delay(r, attempt):
+    """Seconds to wait before retrying a rate-limited response.
+
+    Prefers Retry-After (in seconds or as an HTTP date), then X-RateLimit-Reset,
+    otherwise backs off exponentially.
+    """
+    retry_after = r.headers.get("Retry-After", "").strip()
+    if retry_after.isdigit():
+        return int(retry_after)
+    if retry_after:
+        try:
+            return parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            pass
+    reset = r.headers.get("X-RateLimit-Reset", "").strip()
+    if reset.isdigit():
+        return int(reset) - time.time()
+    return 2 ** attempt
+
+def is_rate_limited(r):
+    """Returns True if GitHub refused a response because of a primary or secondary rate limit."""
+    return r.status_code == 429 or (r.status_code == 403 and (
+        "Retry-After" in r.headers or r.headers.get("X-RateLimit-Remaining") == "0"))
+
+def github_request(method, url, headers=None, resource="core", **kwargs):
+    """Sends a GitHub API request, rotating tokens and backing off when rate limited.
+
+    Auth comes from the token rotation for the given rate-limit resource and is
+    picked afresh on every attempt; headers only carries any extra request headers.
+    """
+    deadline = time.monotonic() + GITHUB_MAX_BACKOFF
+    for attempt in range(GITHUB_MAX_RETRIES + 1):
+        attempt_headers = {**(headers or {}), **(github_headers(resource) or {})}
+        r = _SESSION.request(method, url, headers=attempt_headers, timeout=5, **kwargs)
+        note_rate_limit(attempt_headers, r)
+        if not is_rate_limited(r) or attempt == GITHUB_MAX_RETRIES:
+            return r
+        delay = max(retry_delay(r, attempt), 1)
+        if "Authorization" in attempt_headers:
+            # Bench this token for as long as GitHub asked, then switch if another has budget
+            key = (attempt_headers["Authorization"].split(" ", 1)[1], resource)
+            with _token_lock:
+                _token_exhausted_until[key] = max(_token_exhausted_until.get(key, 0), time.time() + delay)
+            if github_token_available(resource):
+                continue
+        # Give up rather than let the total wait run past GITHUB_MAX_BACKOFF
+        if time.monotonic() + delay > deadline:
+            return r
+        time.sleep(delay)
+    return r
+
+def cache_expiry(r):
+    """Returns the epoch time until which a response may be reused.
+
+    Uses the Cache-Control max-age, stretched to X-Poll-Interval when GitHub asks for slower polling.
+    """
+    ttl = int(r.headers.get("X-Poll-Interval", 0))
+    for directive in r.headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            ttl = max(ttl, int(value))
+    return time.time() + ttl if ttl else 0
+
+def poll_interval(r):
+    """Seconds to wait before polling again, from X-Poll-Interval and the remaining rate budget."""
+    interval = max(GITHUB_POLL_INTERVAL, int(r.headers.get("X-Poll-Interval", 0)))
+    remaining = r.headers.get("X-RateLimit-Remaining")
+    reset = r.headers.get("X-RateLimit-Reset")
+    if remaining is not None and reset is not None:
+        # Spread what is left of every token's budget evenly over the time until it resets
+        budget = max(int(remaining), 1) * len(github_tokens())
+        interval = max(interval, (float(reset) - time.time()) / budget)
+    return interval
+
+def github_json(url):
+    """GETs a GitHub API URL as JSON through the on-disk HTTP cache.
+
+    Fresh entries (within max-age) are served without a request; stale ones are
+    revalidated by ETag/Last-Modified. Returns (status_code, data), and a 304 is
+    answered from the cache as a 200.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    cached = conn.execute("SELECT etag, last_modified, body, expires FROM http_cache WHERE url = ?", (url,)).fetchone()
+    conn.close()
+    headers = {}
+    if cached:
+        etag, last_modified, body, expires = cached
+        if expires and expires > time.time():
+            return 200, orjson.loads(body)
+        # Send both validators; whichever the endpoint supports earns the 304
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    r = github_request("GET", url, headers)
+    if r.status_code == 304 and cached:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("UPDATE http_cache SET expires = ? WHERE url = ?", (cache_expiry(r), url))
+        conn.commit()
+        conn.close()
+        return 200, orjson.loads(body)
+    if r.status_code != 200:
+        return r.status_code, None
+    # Raw bytes go straight to orjson and the cache row, skipping any str decode
+    body = r.content
+    if r.headers.get("ETag") or r.headers.get("Last-Modified"):
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("INSERT OR REPLACE INTO http_cache (url, etag, last_modified, body, expires) VALUES (?, ?, ?, ?, ?)",
+                     (url, r.headers.get("ETag"), r.headers.get("Last-Modified"), body, cache_expiry(r)))
+        conn.commit()
+        conn.close()
+    return r.status_code, orjson.loads(body)
+
 def get_latest_github_info(owner, repo):
     """Fetches the latest version from GitHub API."""
-    if not GITHUB_TOKEN:
+    if not github_tokens():
         return "Missing Token", "N/A"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"}
     try:
         # 1. Try Releases
-        r = requests.get(f"https://api.github.com/repos/{owner}/{repo}/releases/latest", headers=headers, timeout=5)
-        if r.status_code == 200:
-            data = r.json()
+        status, data = github_json(f"https://api.github.com/repos/{owner}/{repo}/releases/latest")
+        if status == 200:
             return data.get("tag_name", "N/A"), data.get("published_at", "")[:10]
         # 2. Fallback to Tags
-        elif r.status_code == 404:
-            tags_r = requests.get(f"https://api.github.com/repos/{owner}/{repo}/tags", headers=headers, timeout=5)
-            if tags_r.status_code == 200 and tags_r.json():
-                return tags_r.json()[0].get('name', 'N/A'), "Tag (Recent)"
+        elif status == 404:
+            tags_status, tags = github_json(f"https://api.github.com/repos/{owner}/{repo}/tags?per_page=1")
+            if tags_status == 200 and tags:
+                return tags[0].get('name', 'N/A'), "Tag (Recent)"
     except:
         pass
     return "N/A", "N/A"
 
+def get_latest_github_info_batch(repos):
+    """Fetches the latest versions of many repos with batched GitHub GraphQL queries.
+
+    Returns a list of (latest, date) tuples in the same order as repos, or None
+    if GraphQL is unavailable so the caller can fall back to per-repo REST lookups.
+    When GraphQL is rate limited the last results (or N/A) are returned instead,
+    since fanning out to one REST call per repo is what secondary limits punish.
+    """
+    if not github_tokens():
+        return [("Missing Token", "N/A")] * len(repos)
+    # Persisted in http_cache so the poll pacing survives restarts
+    key = "graphql:" + json.dumps(repos)
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute("SELECT body, expires FROM http_cache WHERE url = ?", (key,)).fetchone()
+    conn.close()
+    cached = [tuple(result) for result in orjson.loads(row[0])] if row else None
+    if cached and row[1] > time.time():
+        return cached
+    results = []
+    interval = GITHUB_POLL_INTERVAL
+    for start in range(0, len(repos), GITHUB_GRAPHQL_BATCH):
+        batch = repos[start:start + GITHUB_GRAPHQL_BATCH]
+        # One aliased repository() lookup per repo; json.dumps yields valid GraphQL string literals
+        fields = " ".join(
+            f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo)}) {{"
+            " latestRelease { tagName publishedAt }"
+            ' refs(refPrefix: "refs/tags/", first: 1, orderBy: {field: TAG_COMMIT_DATE, direction: DESC})'
+            " { nodes { name } } }"
+            for i, (owner, repo) in enumerate(batch))
+        try:
+            r = github_request("POST", "https://api.github.com/graphql", resource="graphql", json={"query": f"query {{ {fields} }}"})
+            payload = orjson.loads(r.content) if r.status_code == 200 else {}
+        except (requests.RequestException, ValueError):
+            return None
+        # GraphQL reports its own rate limit as a 200 with a RATE_LIMITED error
+        if is_rate_limited(r) or any(e.get("type") == "RATE_LIMITED" for e in payload.get("errors") or []):
+            return cached or [("N/A", "N/A")] * len(repos)
+        data = payload.get("data")
+        if data is None:
+            return None
+        interval = max(interval, poll_interval(r))
+        # Unknown repos come back as null with an entry in "errors"; the rest still resolve
+        for i in range(len(batch)):
+            node = data.get(f"r{i}")
+            if not node:
+                results.append(("N/A", "N/A"))
+            elif node.get("latestRelease"):
+                release = node["latestRelease"]
+                results.append((release.get("tagName") or "N/A", (release.get("publishedAt") or "")[:10]))
+            elif node.get("refs") and node["refs"]["nodes"]:
+                results.append((node["refs"]["nodes"][0].get("name", "N/A"), "Tag (Recent)"))
+            else:
+                results.append(("N/A", "N/A"))
+    conn = sqlite3.connect(DB_PATH)
+    # Only the current repo list is worth keeping; older lists are gone from the dashboard
+    conn.execute("DELETE FROM http_cache WHERE url LIKE 'graphql:%'")
+    conn.execute("INSERT INTO http_cache (url, body, expires) VALUES (?, ?, ?)",
+                 (key, orjson.dumps(results), time.time() + interval))
+    conn.commit()
+    conn.close()
+    return results
+
+def same_version(a, b):
+    """Compares versions leniently so 'v1.2.3' and '1.2.3' count as the same release."""
+    try:
+        return Version(a.strip().lstrip("vV")) == Version(b.strip().lstrip("vV"))
+    except InvalidVersion:
+        return a.strip().lower() == b.strip().lower()
+
+class SafeLinks(Treeprocessor):
+    """Strips link and image URLs whose scheme is not http, https or mailto."""
+    ALLOWED_SCHEMES = ("http", "https", "mailto")
+
+    def run(self, root):
+        for el in root.iter():
+            for attr in ("href", "src"):
+                url = el.get(attr)
+                if url is not None and not self.is_safe(url):
+                    el.set(attr, "#")
+
+    def is_safe(self, url):
+        # Decode entities (including Markdown's obfuscated mailto links) the way a browser would
+        url = unescape(url.replace(AMP_SUBSTITUTE, "&"))
+        url = "".join(ch for ch in url if ch > " ").lower()
+        scheme, sep, _ = url.partition(":")
+        # No scheme before the first path/query/fragment delimiter means a relative URL
+        if not sep or any(ch in scheme for ch in "/?#"):
+            return True
+        return scheme in self.ALLOWED_SCHEMES
+
+@lru_cache(maxsize=256)
+def render_notes(notes):
+    """Renders Markdown notes to HTML, memoized since notes rarely change between loads.
+
+    The result is inserted into the page unescaped, so raw HTML in the notes is
+    escaped rather than passed through and javascript:-style link URLs are dropped.
+    """
+    md = markdown.Markdown()
+    md.preprocessors.deregister("html_block")
+    md.inlinePatterns.deregister("html")
+    # Priority 0 runs after the inline processor has built the <a>/<img> elements
+    md.treeprocessors.register(SafeLinks(md), "safe_links", 0)
+    return md.convert(notes)
+
+@lru_cache(maxsize=None)
+def dashboard_template():
+    """Compiles HTML_TEMPLATE once; render_template_string would recompile it on every request."""
+    return app.jinja_env.from_string(HTML_TEMPLATE)
+
 # --- ROUTES ---
 @app.route('/logo.png')
 def serve_logo():
@@ -62,31 +377,43 @@ def index():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     # Sort to keep the system repo at the very top
-    c.execute("SELECT * FROM repos ORDER BY (repo = 'version-monitor') DESC, repo ASC")
+    c.execute("SELECT * FROM repos ORDER BY (owner = ? AND repo = ?) DESC, repo ASC", (SYSTEM_OWNER, SYSTEM_REPO))
     rows = c.fetchall()
-    
+    conn.close()
+
+    # One GraphQL round-trip covers every repo; fall back to parallel REST lookups if it fails
+    # (but not when rate limited, where the batch serves its last results instead)
+    repos = [(row[1], row[2]) for row in rows]
+    latest_info = get_latest_github_info_batch(repos)
+    if latest_info is None:
+        with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as pool:
+            latest_info = list(pool.map(lambda r: get_latest_github_info(*r), repos))
+
     services = []
-    for row in rows:
+    for row, (latest, date) in zip(rows, latest_info):
         rid, owner, repo, current, notes = row
-        latest, date = get_latest_github_info(owner, repo)
         
         # Check if this is the system repo
-        is_system = (repo == "version-monitor" and owner == "darenbooth")
+        is_system = (repo == SYSTEM_REPO and owner == SYSTEM_OWNER)
         
         # Force the system repo to show the hardcoded DASHBOARD_VERSION
         display_current = DASHBOARD_VERSION if is_system else (current or "Unknown")
         
         status = "update"
         if latest == "N/A": status = "unknown"
-        elif display_current == latest: status = "ok"
+        elif same_version(display_current, latest): status = "ok"
 
         services.append({
             "id": rid, "owner": owner, "name": repo, "current": display_current,
-            "latest": latest, "date": date, "notes": markdown.markdown(notes or ""),
+            "latest": latest, "date": date, "notes": render_notes(notes or ""),
             "raw_notes": notes or "", "status": status, "is_system": is_system
         })
-    conn.close()
-    return render_template_string(HTML_TEMPLATE, services=services, version=DASHBOARD_VERSION)
+    html = render_template(dashboard_template(), services=services, version=DASHBOARD_VERSION)
+    # Tag the page by content so browsers get a 304 when nothing on the dashboard changed
+    response = make_response(html)
+    response.set_etag(hashlib.blake2b(html.encode(), digest_size=16).hexdigest())
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/add', methods=['POST'])
 def add():
@@ -118,7 +445,7 @@ def update_notes():
 def delete(repo_id):
     conn = sqlite3.connect(DB_PATH)
     # Security: Prevent deletion of the system repo
-    conn.execute("DELETE FROM repos WHERE id = ? AND repo != 'version_manager'", (repo_id,))
+    conn.execute("DELETE FROM repos WHERE id = ? AND NOT (owner = ? AND repo = ?)", (repo_id, SYSTEM_OWNER, SYSTEM_REPO))
     conn.commit()
     conn.close()
     return redirect('/')
@@ -237,6 +564,17 @@ HTML_TEMPLATE = """
 </html>
 """
 
+def ensure_config():
+    """Loads .env (if python-dotenv is available) and warns when no GitHub token is configured."""
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    if not github_tokens():
+        print("Warning: GITHUB_TOKEN is not set; latest versions will show 'Missing Token'.")
+
 if __name__ == '__main__':
+    ensure_config()
     init_db()
     app.run(host='0.0.0.0', port=80)